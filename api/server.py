@@ -1,7 +1,18 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import msgspec
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.decorator import cache
+from redis import asyncio as aioredis
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import AsyncMongoClient, ReturnDocument
+from gridfs import AsyncGridFSBucket
+from bson import ObjectId
+from bson.errors import InvalidId
+from gridfs.errors import NoFile
+import base64
 import os
 import logging
 from pathlib import Path
@@ -13,13 +24,17 @@ from datetime import datetime
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection — the client is created in the startup hook so each
+# Uvicorn worker builds its pool on its own event loop
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+client: Optional[AsyncMongoClient] = None
+db = None
+fs_bucket = None
 
 # Create the main app without a prefix
-app = FastAPI()
+# orjson serializes datetime/UUID natively and is much faster than the default
+# JSONResponse encoder
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -64,19 +79,25 @@ class EngineInfo(BaseModel):
     torque: Optional[str] = ""
 
 class ChecklistItem(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     text: str
     completed: bool = False
     completed_at: Optional[datetime] = None
 
 class Photo(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    base64_data: str
+    # Only metadata lives in the checklist document; the image bytes are
+    # stored in GridFS under gridfs_id and served by GET /photos/{gridfs_id}
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    gridfs_id: str
     description: Optional[str] = ""
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+class PhotoCreate(BaseModel):
+    base64_data: str
+    description: Optional[str] = ""
+
 class VehicleChecklist(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     title: str
     vehicle_info: VehicleInfo
     engine_info: EngineInfo
@@ -105,6 +126,23 @@ class VehicleChecklistUpdate(BaseModel):
     research_items: Optional[List[ChecklistItem]] = None
     photos: Optional[List[Photo]] = None
 
+_VALID_SECTIONS = frozenset({"tasks", "parts_to_install", "maintenance", "research_items"})
+_INVALID_SECTION_MSG = f"Invalid section. Must be one of: {sorted(_VALID_SECTIONS)}"
+
+async def _invalidate_checklist_cache():
+    """Drop cached checklist reads after any write"""
+    # Never fail a completed Mongo write because Redis is unavailable;
+    # stale reads age out within the cache TTL anyway
+    try:
+        await FastAPICache.clear(namespace="checklists")
+    except Exception:
+        logger.warning("Failed to clear checklist cache", exc_info=True)
+
+def _now() -> datetime:
+    """One timestamp per request, so related fields (updated_at,
+    completed_at, timestamp) compare equal instead of microseconds apart"""
+    return datetime.utcnow()
+
 # API Routes
 @api_router.get("/")
 async def root():
@@ -113,169 +151,313 @@ async def root():
 @api_router.post("/checklists", response_model=VehicleChecklist)
 async def create_checklist(checklist_data: VehicleChecklistCreate):
     """Create a new vehicle checklist"""
-    checklist_dict = checklist_data.dict()
-    checklist = VehicleChecklist(**checklist_dict)
-    
+    # Documents are validated once here at write time; the read endpoints
+    # return the stored documents as-is without re-running validation
+    now = _now()
+    checklist_dict = checklist_data.dict(exclude_unset=True)
+    checklist = VehicleChecklist(**checklist_dict, created_at=now, updated_at=now)
+
     result = await db.checklists.insert_one(checklist.dict())
     if result.inserted_id:
+        await _invalidate_checklist_cache()
         return checklist
     else:
         raise HTTPException(status_code=400, detail="Failed to create checklist")
 
-@api_router.get("/checklists", response_model=List[VehicleChecklist])
-async def get_checklists(is_template: Optional[bool] = None):
-    """Get all vehicle checklists, optionally filter by template status"""
+@api_router.post("/checklists/bulk", response_model=List[VehicleChecklist])
+async def create_checklists_bulk(checklists_data: List[VehicleChecklistCreate]):
+    """Create multiple vehicle checklists in a single write"""
+    if not checklists_data:
+        return []
+
+    now = _now()
+    checklists = [
+        VehicleChecklist(**data.dict(exclude_unset=True), created_at=now, updated_at=now)
+        for data in checklists_data
+    ]
+    # ordered=False lets the server apply the inserts in parallel
+    await db.checklists.insert_many(
+        [checklist.dict() for checklist in checklists], ordered=False
+    )
+    await _invalidate_checklist_cache()
+    return checklists
+
+# The list endpoint returns summaries only; item arrays and photo
+# metadata come from GET /checklists/{id}
+_SUMMARY_PROJECTION = {
+    "photos": 0,
+    "tasks": 0,
+    "parts_to_install": 0,
+    "maintenance": 0,
+    "research_items": 0,
+}
+
+@api_router.get("/checklists")
+@cache(expire=30, namespace="checklists")
+async def get_checklists(
+    is_template: Optional[bool] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+):
+    """Get a page of vehicle checklist summaries, newest first"""
     query = {}
     if is_template is not None:
         query["is_template"] = is_template
-    
-    checklists = await db.checklists.find(query).to_list(1000)
-    return [VehicleChecklist(**checklist) for checklist in checklists]
 
-@api_router.get("/checklists/{checklist_id}", response_model=VehicleChecklist)
+    # The documents were validated on insert, so skip the response_model
+    # re-validation pass and serialize them directly with orjson
+    cursor = (
+        db.checklists.find(query, _SUMMARY_PROJECTION)
+        .sort("updated_at", -1)
+        .skip(skip)
+        .limit(limit)
+    )
+    checklists = await cursor.to_list(limit)
+    for checklist in checklists:
+        checklist.pop("_id", None)
+    # Plain data so the cache coder can store it; the app-default
+    # ORJSONResponse still handles serialization on the way out
+    return checklists
+
+# Encodes one document per line for the streaming endpoint
+_ndjson_encoder = msgspec.json.Encoder()
+
+@api_router.get("/checklists.ndjson")
+async def stream_checklists(is_template: Optional[bool] = None):
+    """Stream full checklists as newline-delimited JSON, newest first"""
+    query = {}
+    if is_template is not None:
+        query["is_template"] = is_template
+
+    # Each document is flushed as soon as Mongo yields it, so peak memory
+    # stays at one batch regardless of collection size
+    async def iter_ndjson():
+        cursor = (
+            db.checklists.find(query)
+            .sort("updated_at", -1)
+            .batch_size(100)
+        )
+        async for doc in cursor:
+            doc.pop("_id", None)
+            yield _ndjson_encoder.encode(doc) + b"\n"
+
+    return StreamingResponse(iter_ndjson(), media_type="application/x-ndjson")
+
+@api_router.get("/checklists/{checklist_id}")
+@cache(expire=30, namespace="checklists")
 async def get_checklist(checklist_id: str):
     """Get a specific vehicle checklist by ID"""
     checklist = await db.checklists.find_one({"id": checklist_id})
     if not checklist:
         raise HTTPException(status_code=404, detail="Checklist not found")
-    return VehicleChecklist(**checklist)
+    checklist.pop("_id", None)
+    return checklist
 
-@api_router.put("/checklists/{checklist_id}", response_model=VehicleChecklist)
+@api_router.put("/checklists/{checklist_id}")
 async def update_checklist(checklist_id: str, update_data: VehicleChecklistUpdate):
     """Update a vehicle checklist"""
-    # Get the existing checklist
-    existing = await db.checklists.find_one({"id": checklist_id})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Checklist not found")
-    
-    # Update only provided fields
-    update_dict = {k: v for k, v in update_data.dict().items() if v is not None}
-    update_dict["updated_at"] = datetime.utcnow()
-    
-    result = await db.checklists.update_one(
+    # Serialize only the fields the client actually sent (tracked via
+    # __fields_set__) instead of dumping every optional field and filtering
+    update_dict = update_data.dict(exclude_unset=True, exclude_none=True)
+    update_dict["updated_at"] = _now()
+
+    # find_one_and_update applies the $set and returns the updated
+    # document in one round trip; photos stay projected out since the
+    # client fetches image bytes separately anyway
+    updated_checklist = await db.checklists.find_one_and_update(
         {"id": checklist_id},
-        {"$set": update_dict}
+        {"$set": update_dict},
+        return_document=ReturnDocument.AFTER,
+        projection={"photos": 0, "_id": 0},
     )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to update checklist")
-    
-    # Return updated checklist
-    updated_checklist = await db.checklists.find_one({"id": checklist_id})
-    return VehicleChecklist(**updated_checklist)
+
+    if updated_checklist is None:
+        raise HTTPException(status_code=404, detail="Checklist not found")
+
+    await _invalidate_checklist_cache()
+    return ORJSONResponse(updated_checklist)
 
 @api_router.delete("/checklists/{checklist_id}")
 async def delete_checklist(checklist_id: str):
     """Delete a vehicle checklist"""
-    result = await db.checklists.delete_one({"id": checklist_id})
-    if result.deleted_count == 0:
+    existing = await db.checklists.find_one(
+        {"id": checklist_id}, {"photos.gridfs_id": 1}
+    )
+    if not existing:
         raise HTTPException(status_code=404, detail="Checklist not found")
+
+    # Remove the GridFS blobs so deleted checklists don't orphan images
+    for photo in existing.get("photos", []):
+        try:
+            await fs_bucket.delete(ObjectId(photo["gridfs_id"]))
+        except Exception:
+            logger.warning("Failed to delete photo %s from GridFS", photo.get("gridfs_id"))
+
+    await db.checklists.delete_one({"id": checklist_id})
+    await _invalidate_checklist_cache()
     return {"message": "Checklist deleted successfully"}
 
 @api_router.post("/checklists/{checklist_id}/items/{section}")
 async def add_checklist_item(checklist_id: str, section: str, item_text: str):
     """Add an item to a specific section of the checklist"""
-    valid_sections = ["tasks", "parts_to_install", "maintenance", "research_items"]
-    if section not in valid_sections:
-        raise HTTPException(status_code=400, detail=f"Invalid section. Must be one of: {valid_sections}")
-    
-    # Check if checklist exists
-    existing = await db.checklists.find_one({"id": checklist_id})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Checklist not found")
+    if section not in _VALID_SECTIONS:
+        raise HTTPException(status_code=400, detail=_INVALID_SECTION_MSG)
     
     # Create new item
     new_item = ChecklistItem(text=item_text)
-    
-    # Add item to the specified section
+
+    # Push directly; matched_count tells us whether the checklist exists
     result = await db.checklists.update_one(
         {"id": checklist_id},
         {
             "$push": {section: new_item.dict()},
-            "$set": {"updated_at": datetime.utcnow()}
+            "$set": {"updated_at": _now()}
         }
     )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to add item")
-    
+
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Checklist not found")
+
+    await _invalidate_checklist_cache()
     return {"message": "Item added successfully", "item": new_item}
 
+@api_router.post("/checklists/{checklist_id}/items/{section}/bulk")
+async def add_checklist_items_bulk(checklist_id: str, section: str, item_texts: List[str]):
+    """Add multiple items to a section of the checklist in one write"""
+    if section not in _VALID_SECTIONS:
+        raise HTTPException(status_code=400, detail=_INVALID_SECTION_MSG)
+
+    if not item_texts:
+        raise HTTPException(status_code=400, detail="No items provided")
+
+    new_items = [ChecklistItem(text=text) for text in item_texts]
+
+    # One $push with $each instead of a round trip per item
+    result = await db.checklists.update_one(
+        {"id": checklist_id},
+        {
+            "$push": {section: {"$each": [item.dict() for item in new_items]}},
+            "$set": {"updated_at": _now()}
+        }
+    )
+
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Checklist not found")
+
+    await _invalidate_checklist_cache()
+    return {"message": "Items added successfully", "items": new_items}
+
 @api_router.put("/checklists/{checklist_id}/items/{section}/{item_id}/toggle")
 async def toggle_checklist_item(checklist_id: str, section: str, item_id: str):
     """Toggle completion status of a checklist item"""
-    valid_sections = ["tasks", "parts_to_install", "maintenance", "research_items"]
-    if section not in valid_sections:
-        raise HTTPException(status_code=400, detail=f"Invalid section. Must be one of: {valid_sections}")
-    
-    # Get the checklist
-    checklist = await db.checklists.find_one({"id": checklist_id})
-    if not checklist:
-        raise HTTPException(status_code=404, detail="Checklist not found")
-    
-    # Find and toggle the item
-    items = checklist.get(section, [])
-    item_found = False
-    
-    for item in items:
-        if item["id"] == item_id:
-            item["completed"] = not item["completed"]
-            item["completed_at"] = datetime.utcnow() if item["completed"] else None
-            item_found = True
-            break
-    
-    if not item_found:
-        raise HTTPException(status_code=404, detail="Item not found")
+    if section not in _VALID_SECTIONS:
+        raise HTTPException(status_code=400, detail=_INVALID_SECTION_MSG)
     
-    # Update the checklist
+    # Flip the item server-side in a single atomic update (aggregation
+    # pipeline form, Mongo 4.2+) instead of read-modify-write round trips,
+    # which also avoids lost updates under concurrent toggles. There is
+    # deliberately no Python-side fallback scan of the section array; a
+    # pre-4.2 server is not supported
+    now = _now()
     result = await db.checklists.update_one(
-        {"id": checklist_id},
-        {
+        {"id": checklist_id, f"{section}.id": item_id},
+        [{
             "$set": {
-                section: items,
-                "updated_at": datetime.utcnow()
+                section: {
+                    "$map": {
+                        "input": f"${section}",
+                        "as": "item",
+                        "in": {
+                            "$cond": [
+                                {"$eq": ["$$item.id", item_id]},
+                                {"$mergeObjects": ["$$item", {
+                                    "completed": {"$not": "$$item.completed"},
+                                    "completed_at": {
+                                        "$cond": [{"$not": "$$item.completed"}, now, None]
+                                    }
+                                }]},
+                                "$$item"
+                            ]
+                        }
+                    }
+                },
+                "updated_at": now
             }
-        }
+        }]
     )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to update item")
-    
+
+    if result.matched_count == 0:
+        # Only the error path pays for a second lookup
+        if await db.checklists.find_one({"id": checklist_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Item not found")
+        raise HTTPException(status_code=404, detail="Checklist not found")
+
+    await _invalidate_checklist_cache()
     return {"message": "Item toggled successfully"}
 
 @api_router.post("/checklists/{checklist_id}/photos")
-async def add_photo(checklist_id: str, photo_data: Photo):
+async def add_photo(checklist_id: str, photo_data: PhotoCreate):
     """Add a photo to the checklist"""
-    # Check if checklist exists
-    existing = await db.checklists.find_one({"id": checklist_id})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Checklist not found")
-    
-    # Add photo
+    try:
+        image_bytes = base64.b64decode(photo_data.base64_data, validate=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid base64 image data")
+
+    # Store the bytes in GridFS and embed only the metadata in the checklist
+    gridfs_id = await fs_bucket.upload_from_stream(
+        f"checklist-{checklist_id}", image_bytes
+    )
+    now = _now()
+    photo = Photo(gridfs_id=str(gridfs_id), description=photo_data.description, timestamp=now)
+
     result = await db.checklists.update_one(
         {"id": checklist_id},
         {
-            "$push": {"photos": photo_data.dict()},
-            "$set": {"updated_at": datetime.utcnow()}
+            "$push": {"photos": photo.dict()},
+            "$set": {"updated_at": now}
         }
     )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to add photo")
-    
-    return {"message": "Photo added successfully", "photo": photo_data}
 
-# Include the router in the main app
-app.include_router(api_router)
+    if result.matched_count == 0:
+        # Don't leave the blob behind if the checklist doesn't exist
+        await fs_bucket.delete(gridfs_id)
+        raise HTTPException(status_code=404, detail="Checklist not found")
+
+    await _invalidate_checklist_cache()
+    return {"message": "Photo added successfully", "photo": photo}
+
+@api_router.get("/photos/{gridfs_id}")
+async def get_photo(gridfs_id: str):
+    """Stream a photo's raw bytes from GridFS"""
+    try:
+        stream = await fs_bucket.open_download_stream(ObjectId(gridfs_id))
+    except (InvalidId, NoFile):
+        raise HTTPException(status_code=404, detail="Photo not found")
 
+    async def iter_chunks():
+        while True:
+            chunk = await stream.readchunk()
+            if not chunk:
+                break
+            yield chunk
+
+    return StreamingResponse(iter_chunks(), media_type="application/octet-stream")
+
+# Register middleware before the router, per the documented Starlette
+# order. CORS_ORIGINS is a comma-separated allow-list; the default "*"
+# keeps the cheap wildcard path, which requires credentials to stay off
+cors_origins = [o.strip() for o in os.environ.get("CORS_ORIGINS", "*").split(",") if o.strip()]
 app.add_middleware(
     CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
+    allow_origins=cors_origins,
+    allow_credentials="*" not in cors_origins,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# Include the router in the main app
+app.include_router(api_router)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -283,6 +465,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_db_client():
+    # The default pool of 100 connections is oversized for a
+    # single-process async server; minPoolSize warms connections so the
+    # first requests don't pay the handshake
+    global client, db, fs_bucket
+    client = AsyncMongoClient(
+        mongo_url,
+        maxPoolSize=20,
+        minPoolSize=5,
+        serverSelectionTimeoutMS=2000,
+        connectTimeoutMS=2000,
+    )
+    db = client[os.environ['DB_NAME']]
+    fs_bucket = AsyncGridFSBucket(db)
+
+@app.on_event("startup")
+async def init_cache():
+    # Redis-backed response cache for the checklist GET endpoints; run the
+    # Redis instance with maxmemory-policy allkeys-lru to bound its RAM
+    redis = aioredis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379"))
+    FastAPICache.init(RedisBackend(redis), prefix="asphalt-armoury")
+
+@app.on_event("startup")
+async def create_indexes():
+    # Every endpoint looks checklists up by "id", and get_checklists
+    # filters on is_template — without indexes both are collection scans
+    await db.checklists.create_index("id", unique=True)
+    await db.checklists.create_index([("is_template", 1), ("updated_at", -1)])
+    # The compound index only serves the updated_at sort when the query
+    # filters on is_template; the unfiltered list and NDJSON paths need
+    # their own sort index
+    await db.checklists.create_index([("updated_at", -1)])
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    if client is not None:
+        await client.close()
\ No newline at end of file